@@ -1,49 +1,68 @@
 import streamlit as st
 import easyocr
+import torch
+import pytesseract
+import ocr_worker
+from ocr_worker import OCR_BATCH_SIZE, pad_to_canvas
+from calendar_batch import encode_batch_request, decode_batch_response
 from PIL import Image
 from openai import OpenAI
 from datetime import datetime, timedelta
 import numpy as np
 import json
+import io
+import hashlib
 import re
-import gc
 import logging
 import time
 import os
+import asyncio
+import threading
+import httpx
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 
 IS_DEPLOYED = os.environ.get('IS_DEPLOYED', 'false').lower() == 'true'
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto').lower()
 
+@st.cache_resource(show_spinner=False)
 def get_api_key():
     return st.secrets["OPENAI_API_KEY"]
 
+@st.cache_resource
 def init_openai_client():
     api_key = get_api_key()
     return OpenAI(api_key=api_key)
 
-MODEL_NAME = "gpt-4"
+MODEL_NAME = "gpt-4o-mini"
+OCR_MAX_SIDE = 1600
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.events']
-CLIENT_CONFIG = {
-    "web": {
-        "client_id": st.secrets["GOOGLE_CLIENT_ID"],
-        "project_id": st.secrets["GOOGLE_PROJECT_ID"],
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_secret": st.secrets["GOOGLE_CLIENT_SECRET"],
-        "redirect_uris": [
-            "https://calstool.streamlit.app/",
-            st.secrets.get("REDIRECT_URI", "https://calstool.streamlit.app/")
-        ]
+CALENDAR_BATCH_URL = 'https://www.googleapis.com/batch/calendar/v3'
+
+@st.cache_resource(show_spinner=False)
+def _client_config():
+    return {
+        "web": {
+            "client_id": st.secrets["GOOGLE_CLIENT_ID"],
+            "project_id": st.secrets["GOOGLE_PROJECT_ID"],
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_secret": st.secrets["GOOGLE_CLIENT_SECRET"],
+            "redirect_uris": [
+                "https://calstool.streamlit.app/",
+                st.secrets.get("REDIRECT_URI", "https://calstool.streamlit.app/")
+            ]
+        }
     }
-}
 
+@st.cache_resource(show_spinner=False)
 def get_redirect_uri():
     if IS_DEPLOYED:
         return st.secrets.get("REDIRECT_URI")
@@ -51,18 +70,32 @@ def get_redirect_uri():
         return "https://calstool.streamlit.app/"
 
 def get_google_auth_flow():
-    redirect_uri = get_redirect_uri()
-    flow = Flow.from_client_config(
-        CLIENT_CONFIG,
-        scopes=SCOPES,
-        redirect_uri=redirect_uri
-    )
-    return flow
+    if 'google_auth_flow' not in st.session_state:
+        redirect_uri = get_redirect_uri()
+        st.session_state.google_auth_flow = Flow.from_client_config(
+            _client_config(),
+            scopes=SCOPES,
+            redirect_uri=redirect_uri
+        )
+    return st.session_state.google_auth_flow
 
 def get_google_credentials():
     if 'google_token' not in st.session_state:
         return None
-    return Credentials.from_authorized_user_info(st.session_state.google_token, SCOPES)
+    creds = Credentials.from_authorized_user_info(st.session_state.google_token, SCOPES)
+    if creds.expired and creds.refresh_token:
+        try:
+            creds.refresh(Request())
+        except RefreshError as e:
+            logging.error(f"Google 토큰 갱신 실패: {str(e)}")
+            st.session_state.pop('google_token', None)
+            return None
+        st.session_state.google_token = credentials_to_dict(creds)
+    return creds
+
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    return httpx.Client(http2=True, timeout=10.0)
 
 def credentials_to_dict(credentials):
     return {
@@ -71,97 +104,262 @@ def credentials_to_dict(credentials):
         'token_uri': credentials.token_uri,
         'client_id': credentials.client_id,
         'client_secret': credentials.client_secret,
-        'scopes': credentials.scopes
+        'scopes': credentials.scopes,
+        'expiry': credentials.expiry.isoformat() + 'Z' if credentials.expiry else None
     }
 
+def _detect_device():
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+def get_ocr_device():
+    if 'ocr_device' not in st.session_state:
+        st.session_state.ocr_device = _detect_device()
+    return st.session_state.ocr_device
+
+def extract_text_from_image_tesseract(image):
+    return pytesseract.image_to_string(image, lang='kor+eng', config='--oem 1 --psm 6')
+
+class TesseractReader:
+    def readtext(self, image_np):
+        text = extract_text_from_image_tesseract(Image.fromarray(image_np))
+        return [(None, line.strip(), None) for line in text.splitlines() if line.strip()]
+
+    def readtext_batched(self, images_np, **kwargs):
+        return [self.readtext(image_np) for image_np in images_np]
+
 @st.cache_resource
-def load_ocr():
-    try:
-        with st.spinner('OCR 모델을 로딩 중입니다. 잠시만 기다려주세요...'):
+def load_ocr(device='cpu'):
+    backend = OCR_BACKEND
+    if backend == 'auto':
+        backend = 'tesseract' if device == 'cpu' and IS_DEPLOYED else 'easyocr'
+    if backend == 'tesseract':
+        return TesseractReader()
+    if backend == 'server':
+        return ocr_worker.OCRServerClient(gpu=(device != 'cpu'))
+    if backend != 'easyocr':
+        raise ValueError(f"알 수 없는 OCR_BACKEND 값입니다: {OCR_BACKEND}")
+    with st.spinner('OCR 모델을 로딩 중입니다. 잠시만 기다려주세요...'):
+        try:
+            reader = easyocr.Reader(['ko', 'en'], gpu=(device != 'cpu'), model_storage_directory='./model')
+        except Exception as e:
+            if device == 'cpu':
+                raise
+            logging.error(f"GPU OCR 초기화 실패, CPU로 전환합니다: {str(e)}")
             reader = easyocr.Reader(['ko', 'en'], gpu=False, model_storage_directory='./model')
-            return reader
-    except Exception as e:
-        st.error(f"OCR 모델 로딩 중 오류 발생: {str(e)}")
-        return None
+        return reader
+
+def release_gpu_memory(reader):
+    device = getattr(reader, 'device', 'cpu')
+    if device == 'cuda' and torch.cuda.is_initialized():
+        torch.cuda.empty_cache()
+        torch.cuda.ipc_collect()
+    elif device == 'mps':
+        torch.mps.empty_cache()
+
+def preprocess_image(image):
+    w, h = image.size
+    scale = min(1.0, OCR_MAX_SIDE / max(w, h))
+    size = (int(w * scale), int(h * scale))
+    image.draft('L', size)
+    image = image.convert('L')
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR)
+    return image
 
 def extract_text_from_image(image):
-    reader = load_ocr()
-    if reader is None:
-        return None
+    reader = load_ocr(get_ocr_device())
     try:
-        image_np = np.array(image)
+        image_np = np.array(preprocess_image(image))
         result = reader.readtext(image_np)
         text = ' '.join([res[1] for res in result])
         del image_np
-        gc.collect()
         return text
-    except Exception as e:
-        st.error(f"이미지에서 텍스트 추출 중 오류 발생: {str(e)}")
+    finally:
+        release_gpu_memory(reader)
+
+def extract_texts_from_images(images):
+    reader = load_ocr(get_ocr_device())
+    try:
+        images_np = [np.array(preprocess_image(image)) for image in images]
+        results = reader.readtext_batched(pad_to_canvas(images_np), batch_size=OCR_BATCH_SIZE)
+        texts = [' '.join([res[1] for res in result]) for result in results]
+        del images_np
+        return texts
+    finally:
+        release_gpu_memory(reader)
+
+_FENCE_RE = re.compile(r'```(?:json)?\s*|\s*```')
+
+def find_json_object(text):
+    start = text.find('{')
+    if start == -1:
         return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    return None
 
 def clean_json_string(json_string):
-    json_string = re.sub(r'```json\s*|\s*```', '', json_string)
-    json_string = json_string.strip()
-    json_string = json_string[json_string.find('{'):json_string.rfind('}')+1]
-    return json_string
+    json_string = _FENCE_RE.sub('', json_string)
+    span = find_json_object(json_string)
+    if span is None:
+        return json_string.strip()
+    return json_string[span[0]:span[1]]
+
+_PROMPT_VERSION = 2
+_SYSTEM_PROMPT = (
+    "공문에서 일정 정보를 추출해 JSON 객체로 반환하세요. 키: "
+    "title(주제), dates('YYYY년 MM월 DD일 HH:MM' 형식 배열, 연도가 없으면 올해), "
+    "location(구체적인 장소), description(간단한 설명), type('신청'|'참여'|'참석'|null)."
+)
 
 def analyze_text_with_ai(client, text):
+    completion = client.chat.completions.create(
+        model=MODEL_NAME,
+        response_format={"type": "json_object"},
+        temperature=0,
+        max_tokens=1000,
+        stream=True,
+        messages=[
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ]
+    )
+    buf = ''
+    for chunk in completion:
+        if not chunk.choices:
+            continue
+        if chunk.choices[0].finish_reason == 'length':
+            raise ValueError("AI 응답이 최대 토큰 수를 넘어 잘렸습니다.")
+        delta = chunk.choices[0].delta.content or ''
+        buf += delta
+        if '}' in delta:
+            span = find_json_object(buf)
+            if span is not None:
+                completion.close()
+                return json.loads(buf[span[0]:span[1]])
+    return json.loads(clean_json_string(buf))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_ocr(img_bytes):
+    return extract_text_from_image(Image.open(io.BytesIO(img_bytes)))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_ocr_batch(uploads):
+    return extract_texts_from_images([Image.open(io.BytesIO(img_bytes)) for img_bytes in uploads])
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_analyze(_client, prompt_version, text_hash, _text):
+    return analyze_text_with_ai(_client, _text)
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+_DATE_RE = re.compile(r'(\d{4})년\s*(\d{1,2})월\s*(\d{1,2})일\s*(\d{1,2}):(\d{2})')
+
+def parse_event_datetime(date):
+    m = _DATE_RE.match(date)
+    if m:
+        try:
+            return datetime(int(m[1]), int(m[2]), int(m[3]), int(m[4]), int(m[5]))
+        except ValueError:
+            pass
+    return None
+
+class CalendarAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f'{status} {message}')
+        self.status = status
+
+def _error_message(body):
     try:
-        completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": """다음 텍스트에서 이벤트 정보를 추출해주세요. JSON 형식으로 다음 정보를 반환해주세요:
-
-1. 주제: 이벤트의 주제 또는 제목
-2. 일시: 'YYYY년 MM월 DD일 HH:MM' 형식으로 제공 (여러 개 가능, 배열로 반환)
-3. 위치: 이벤트 장소 (구체적인 주소나 장소명 포함)
-4. 설명: 이벤트에 대한 간단한 설명
-5. 이벤트_유형: '신청', '참여', '참석' 중 하나 (해당되는 경우)
-6. 알림_설정: 
-   - '신청' 관련 내용이면 "이벤트 2일 전"
-   - '참여' 또는 '참석' 관련 내용이면 "당일 오전 8시 45분"
-   - 그 외의 경우 "기본 알림"
-
-현재 연도를 기준으로 정보를 추출하세요. JSON만 반환하고 다른 텍스트는 포함하지 마세요."""},
-                {"role": "user", "content": text}
-            ]
-        )
-        return clean_json_string(completion.choices[0].message.content.strip())
-    except Exception as e:
-        st.error(f"AI 분석 중 오류 발생: {str(e)}")
-        return None
+        return json.loads(body)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return body
+
+def insert_calendar_events(creds, events):
+    if not events:
+        return []
+    boundary = f'batch_{os.urandom(8).hex()}'
+    headers = {'Content-Type': f'multipart/mixed; boundary={boundary}'}
+    creds.apply(headers)
+    r = get_http_client().post(CALENDAR_BATCH_URL, headers=headers, content=encode_batch_request(events, boundary))
+    if r.status_code != 200:
+        raise CalendarAPIError(r.status_code, _error_message(r.text))
+
+    results = []
+    for response in decode_batch_response(r.headers['Content-Type'], r.content, len(events)):
+        if response is None:
+            results.append(CalendarAPIError(502, "배치 응답에 결과가 누락되었습니다."))
+            continue
+        status, body = response
+        if status >= 300:
+            results.append(CalendarAPIError(status, _error_message(body)))
+        else:
+            results.append(json.loads(body))
+    return results
+
+def calendar_error_message(error):
+    if error.status in [401, 403]:
+        return 'warning', "Google 계정 연동이 필요합니다."
+    return 'error', f'Google Calendar API 오류 발생: {error}'
+
+def event_key(text, date, location):
+    return hashlib.blake2b(f'{text}\0{date}\0{location}'.encode(), digest_size=8).hexdigest()
 
-def create_google_calendar_event(event_info):
+@st.cache_resource(show_spinner=False)
+def get_calendar_lock():
+    return threading.Lock()
+
+def create_google_calendar_event(event_dict):
     if 'google_token' not in st.session_state:
-        st.warning("Google 계정 연동이 필요합니다.")
-        return None
+        return None, [('warning', "Google 계정 연동이 필요합니다.")]
 
     creds = get_google_credentials()
     if not creds:
-        st.warning("Google 계정 연동이 필요합니다.")
-        return None
+        return None, [('warning', "Google 계정 연동이 필요합니다.")]
 
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        event_dict = json.loads(event_info)
-        
-        text = event_dict.get('주제', '')
-        dates = event_dict.get('일시', [])
-        location = event_dict.get('위치', '')
-        details = event_dict.get('설명', '')
-        reminder = event_dict.get('알림_설정', '기본 알림')
+        text = event_dict.get('title', '')
+        dates = event_dict.get('dates', [])
+        location = event_dict.get('location', '')
+        details = event_dict.get('description', '')
+        event_type = event_dict.get('type')
 
         if isinstance(dates, str):
             dates = [dates]
+        dates = list(dict.fromkeys(dates))
 
-        created_events = []
+        events = {}
 
         for date in dates:
-            try:
-                dt = datetime.strptime(date, "%Y년 %m월 %d일 %H:%M")
-            except ValueError:
+            dt = parse_event_datetime(date)
+            key = event_key(text, dt.isoformat() if dt else date, location)
+            if key in events:
+                continue
+            if dt is None:
                 dt = datetime.now() + timedelta(days=7)
-            
             end_time = dt + timedelta(hours=1)
 
             event = {
@@ -178,14 +376,14 @@ def create_google_calendar_event(event_info):
                 },
             }
 
-            if reminder == "이벤트 2일 전":
+            if event_type == '신청':
                 event['reminders'] = {
                     'useDefault': False,
                     'overrides': [
                         {'method': 'popup', 'minutes': 2 * 24 * 60},
                     ],
                 }
-            elif reminder == "당일 오전 8시 45분":
+            elif event_type in ('참여', '참석'):
                 minutes_until_reminder = int((dt.replace(hour=8, minute=45) - dt).total_seconds() / 60)
                 if minutes_until_reminder < 0:
                     minutes_until_reminder = 0
@@ -198,19 +396,88 @@ def create_google_calendar_event(event_info):
             else:
                 event['reminders'] = {'useDefault': True}
 
-            created_event = service.events().insert(calendarId='primary', body=event).execute()
-            created_events.append(created_event)
+            events[key] = event
+
+        lock = get_calendar_lock()
+        with lock:
+            created = st.session_state.setdefault('created_events', {})
+            in_flight = st.session_state.setdefault('in_flight_event_keys', set())
+            pending = [key for key in events if key not in created and key not in in_flight]
+            in_flight.update(pending)
+
+        results = []
+        try:
+            results = insert_calendar_events(creds, [events[key] for key in pending])
+        finally:
+            with lock:
+                for key, result in zip(pending, results):
+                    if not isinstance(result, CalendarAPIError):
+                        created[key] = result
+                in_flight.difference_update(pending)
+
+        messages = [calendar_error_message(result) for result in results if isinstance(result, CalendarAPIError)]
+        return [created[key] for key in events if key in created], messages
+    except CalendarAPIError as error:
+        return None, [calendar_error_message(error)]
+    except Exception as e:
+        return None, [('error', f'예기치 못한 오류 발생: {str(e)}')]
+
+async def _run_in_thread(func, *args):
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+
+    return await asyncio.to_thread(run)
+
+async def process_upload(client, extracted_text):
+    if not extracted_text:
+        return extracted_text, None, None, []
+    try:
+        analyzed_info = await _run_in_thread(_cached_analyze, client, _PROMPT_VERSION, text_hash(extracted_text), extracted_text)
+    except Exception as e:
+        return extracted_text, None, None, [('error', f"AI 분석 중 오류 발생: {str(e)}")]
+    if not analyzed_info:
+        return extracted_text, analyzed_info, None, []
+    created_events, messages = await _run_in_thread(create_google_calendar_event, analyzed_info)
+    return extracted_text, analyzed_info, created_events, messages
 
-        return created_events
-    except HttpError as error:
-        if error.resp.status in [401, 403]:
-            st.warning("Google 계정 연동이 필요합니다.")
+async def process_uploads(client, uploads):
+    try:
+        if len(uploads) == 1:
+            texts = [await _run_in_thread(_cached_ocr, uploads[0])]
         else:
-            st.error(f'Google Calendar API 오류 발생: {error}')
-        return None
+            texts = await _run_in_thread(_cached_ocr_batch, uploads)
     except Exception as e:
-        st.error(f'예기치 못한 오류 발생: {str(e)}')
-        return None
+        message = ('error', f"이미지에서 텍스트 추출 중 오류 발생: {str(e)}")
+        return [(None, None, None, [message]) for _ in uploads]
+    return await asyncio.gather(*(process_upload(client, text) for text in texts))
+
+def show_messages(messages):
+    for level, message in messages:
+        getattr(st, level)(message)
+
+def render_result(extracted_text, analyzed_info, created_events, messages):
+    if not extracted_text:
+        show_messages(messages)
+        st.error("이미지에서 텍스트를 추출하지 못했습니다.")
+        return
+    st.markdown("<h3 class='sub-header'>추출된 텍스트</h3>", unsafe_allow_html=True)
+    st.markdown(f"<div class='info-box'>{extracted_text}</div>", unsafe_allow_html=True)
+    if not analyzed_info:
+        show_messages(messages)
+        st.error("AI 분석에 실패했습니다.")
+        return
+    st.markdown("<h3 class='sub-header'>분석 결과</h3>", unsafe_allow_html=True)
+    st.json(analyzed_info)
+    show_messages(messages)
+    if created_events:
+        st.markdown("<h3 class='sub-header'>생성된 Google 캘린더 이벤트</h3>", unsafe_allow_html=True)
+        for i, event in enumerate(created_events, 1):
+            st.markdown(f"{i}. [이벤트 {i} 캘린더에 추가하기]({event.get('htmlLink')})")
+    elif not messages:
+        st.info("Google 계정 연동이 필요합니다.")
 
 def main():
     st.set_page_config(page_title="공문 이미지 변환기", page_icon="📅", layout="centered")
@@ -289,6 +556,7 @@ def main():
         st.success("Google 계정이 연동되었습니다.")
         if st.button("Google 계정 연동 해제"):
             st.session_state.pop('google_token', None)
+            st.session_state.pop('created_events', None)
             st.experimental_rerun()
 
     api_key = get_api_key()
@@ -299,37 +567,26 @@ def main():
     client = init_openai_client()
 
     st.markdown("<h2 class='sub-header'>🍀 공문 이미지 업로드</h2>", unsafe_allow_html=True)
-    uploaded_file = st.file_uploader("공문 이미지를 업로드하세요", type=["png", "jpg", "jpeg"])
+    uploaded_files = st.file_uploader("공문 이미지를 업로드하세요", type=["png", "jpg", "jpeg"], accept_multiple_files=True)
 
-    if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption='업로드된 이미지', use_column_width=True)
+    if uploaded_files:
+        uploads = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+        for uploaded_file, img_bytes in zip(uploaded_files, uploads):
+            image = Image.open(io.BytesIO(img_bytes))
+            st.image(image, caption=f'업로드된 이미지: {uploaded_file.name}', use_column_width=True)
 
         if st.button("이미지 분석 및 이벤트 생성"):
             with st.spinner('이미지를 분석 중입니다...'):
                 try:
-                    extracted_text = extract_text_from_image(image)
-                    if extracted_text:
-                        st.markdown("<h3 class='sub-header'>추출된 텍스트</h3>", unsafe_allow_html=True)
-                        st.markdown(f"<div class='info-box'>{extracted_text}</div>", unsafe_allow_html=True)
-                        analyzed_info = analyze_text_with_ai(client, extracted_text)
-                        if analyzed_info:
-                            st.markdown("<h3 class='sub-header'>분석 결과</h3>", unsafe_allow_html=True)
-                            st.json(analyzed_info)
-
-                            created_events = create_google_calendar_event(analyzed_info)
-                            if created_events:
-                                st.markdown("<h3 class='sub-header'>생성된 Google 캘린더 이벤트</h3>", unsafe_allow_html=True)
-                                for i, event in enumerate(created_events, 1):
-                                    st.markdown(f"{i}. [이벤트 {i} 캘린더에 추가하기]({event.get('htmlLink')})")
-                            else:
-                                st.info("Google 계정 연동이 필요합니다.")
-                        else:
-                            st.error("AI 분석에 실패했습니다.")
-                    else:
-                        st.error("이미지에서 텍스트를 추출하지 못했습니다.")
+                    results = asyncio.run(process_uploads(client, uploads))
                 except Exception as e:
                     st.error(f"이미지 처리 중 예기치 못한 오류 발생: {str(e)}")
+                    results = []
+
+            for uploaded_file, result in zip(uploaded_files, results):
+                if len(uploaded_files) > 1:
+                    st.markdown(f"<h2 class='sub-header'>📄 {uploaded_file.name}</h2>", unsafe_allow_html=True)
+                render_result(*result)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
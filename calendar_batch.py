@@ -0,0 +1,32 @@
+import email.parser
+import json
+import re
+
+CALENDAR_EVENTS_PATH = '/calendar/v3/calendars/primary/events'
+
+def encode_batch_request(events, boundary):
+    parts = []
+    for i, event in enumerate(events):
+        parts.append(
+            f'--{boundary}\r\n'
+            'Content-Type: application/http\r\n'
+            f'Content-ID: <{i}>\r\n\r\n'
+            f'POST {CALENDAR_EVENTS_PATH} HTTP/1.1\r\n'
+            'Content-Type: application/json\r\n\r\n'
+            f'{json.dumps(event)}\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n')
+    return ''.join(parts).encode()
+
+def decode_batch_response(content_type, content, count):
+    message = email.parser.BytesParser().parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + content
+    )
+    responses = {}
+    for part in message.get_payload():
+        request_id = int(part['Content-ID'].strip('<>').rsplit('-', 1)[-1])
+        payload = part.get_payload(decode=True).decode('utf-8')
+        status_line, payload = payload.split('\n', 1)
+        body = re.split(r'\r?\n\r?\n', payload, maxsplit=1)[-1]
+        responses[request_id] = (int(status_line.split(' ', 2)[1]), body)
+    return [responses.get(i) for i in range(count)]
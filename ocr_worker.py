@@ -0,0 +1,152 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import easyocr
+import numpy as np
+
+OCR_SOCKET = os.environ.get('OCR_SOCKET', '/tmp/calstools-ocr.sock')
+BATCH_WINDOW = 0.05
+OCR_BATCH_SIZE = 16
+
+def pad_to_canvas(images):
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    canvases = []
+    for image in images:
+        canvas = np.full((height, width) + image.shape[2:], 255, dtype=image.dtype)
+        canvas[:image.shape[0], :image.shape[1]] = image
+        canvases.append(canvas)
+    return canvases
+
+def get_authkey():
+    authkey = os.environ.get('OCR_SERVER_AUTHKEY')
+    if authkey:
+        return authkey.encode()
+    return bytes(multiprocessing.current_process().authkey)
+
+def _handle_connection(conn, pending):
+    replies = queue.Queue()
+    try:
+        while True:
+            images = conn.recv()
+            for image in images:
+                pending.put((image, replies))
+            conn.send([replies.get() for _ in images])
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+def _accept_loop(listener, pending):
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logging.error(f"OCR 서버 연결 수락 실패: {str(e)}")
+            continue
+        threading.Thread(target=_handle_connection, args=(conn, pending), daemon=True).start()
+
+def _next_batch(pending):
+    batch = [pending.get()]
+    deadline = time.monotonic() + BATCH_WINDOW
+    while len(batch) < OCR_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(pending.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+def serve(address, gpu, authkey):
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    pending = queue.Queue()
+    threading.Thread(target=_accept_loop, args=(listener, pending), daemon=True).start()
+
+    try:
+        reader = easyocr.Reader(['ko', 'en'], gpu=gpu, model_storage_directory='./model')
+    except Exception as e:
+        if not gpu:
+            raise
+        logging.error(f"GPU OCR 초기화 실패, CPU로 전환합니다: {str(e)}")
+        reader = easyocr.Reader(['ko', 'en'], gpu=False, model_storage_directory='./model')
+
+    while True:
+        batch = _next_batch(pending)
+        images = [image for image, _ in batch]
+        try:
+            if len(images) == 1:
+                results = [reader.readtext(images[0])]
+            else:
+                results = reader.readtext_batched(pad_to_canvas(images), batch_size=OCR_BATCH_SIZE)
+        except Exception as e:
+            logging.error(f"OCR 서버 처리 중 오류 발생: {str(e)}")
+            results = [RuntimeError(str(e))] * len(images)
+        for (_, replies), result in zip(batch, results):
+            replies.put(result)
+
+def _is_running(address, authkey):
+    try:
+        Client(address, family='AF_UNIX', authkey=authkey).close()
+        return True
+    except AuthenticationError:
+        raise RuntimeError(
+            "OCR 서버 인증에 실패했습니다. 여러 프로세스가 OCR 서버를 공유하려면 "
+            "모든 프로세스에 같은 OCR_SERVER_AUTHKEY를 설정하세요."
+        )
+    except OSError:
+        return False
+
+_start_lock = threading.Lock()
+
+def start_server(gpu, address=OCR_SOCKET, timeout=30):
+    authkey = get_authkey()
+    with _start_lock:
+        if os.path.exists(address):
+            if _is_running(address, authkey):
+                return address
+            os.unlink(address)
+
+        process = multiprocessing.get_context('spawn').Process(target=serve, args=(address, gpu, authkey), daemon=True)
+        process.start()
+
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(address):
+            if not process.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("OCR 서버를 시작하지 못했습니다.")
+            time.sleep(0.1)
+        return address
+
+class OCRServerClient:
+    def __init__(self, gpu, address=OCR_SOCKET):
+        self.gpu = gpu
+        self.authkey = get_authkey()
+        self.address = start_server(gpu, address)
+
+    def _request(self, images_np):
+        with Client(self.address, family='AF_UNIX', authkey=self.authkey) as conn:
+            conn.send(images_np)
+            return conn.recv()
+
+    def readtext_batched(self, images_np, **kwargs):
+        images_np = list(images_np)
+        try:
+            results = self._request(images_np)
+        except (ConnectionError, FileNotFoundError, EOFError) as e:
+            logging.error(f"OCR 서버 연결 끊김, 서버를 다시 시작합니다: {str(e)}")
+            self.address = start_server(self.gpu, self.address)
+            results = self._request(images_np)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def readtext(self, image_np):
+        return self.readtext_batched([image_np])[0]
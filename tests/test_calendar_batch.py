@@ -0,0 +1,55 @@
+import email.parser
+import json
+import unittest
+
+from calendar_batch import CALENDAR_EVENTS_PATH, decode_batch_response, encode_batch_request
+
+def _http_part(content_id, status_line, body):
+    return (
+        '--batch_test\r\n'
+        'Content-Type: application/http\r\n'
+        f'Content-ID: <response-{content_id}>\r\n\r\n'
+        f'{status_line}\r\n'
+        'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+        f'{body}\r\n'
+    )
+
+class CalendarBatchTest(unittest.TestCase):
+    def test_encode_request_keeps_non_ascii_summary(self):
+        events = [{'summary': '교육 연수'}, {'summary': '학부모 상담'}]
+        content = encode_batch_request(events, 'batch_test')
+
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: multipart/mixed; boundary=batch_test\r\n\r\n' + content
+        )
+        parts = message.get_payload()
+        self.assertEqual([part['Content-ID'] for part in parts], ['<0>', '<1>'])
+        request = parts[0].get_payload(decode=True).decode('utf-8')
+        self.assertTrue(request.startswith(f'POST {CALENDAR_EVENTS_PATH} HTTP/1.1'))
+        self.assertEqual(json.loads(request.split('\r\n\r\n', 1)[1]), events[0])
+
+    def test_decode_mixed_response_in_request_order(self):
+        content = (
+            _http_part(1, 'HTTP/1.1 403 Forbidden', '{"error": {"message": "권한 없음"}}')
+            + _http_part(0, 'HTTP/1.1 200 OK', '{"id": "a", "summary": "교육 연수"}')
+            + '--batch_test--\r\n'
+        ).encode('utf-8')
+
+        responses = decode_batch_response('multipart/mixed; boundary=batch_test', content, 2)
+
+        self.assertEqual([status for status, _ in responses], [200, 403])
+        self.assertEqual(json.loads(responses[0][1]), {'id': 'a', 'summary': '교육 연수'})
+        self.assertEqual(json.loads(responses[1][1])['error']['message'], '권한 없음')
+
+    def test_decode_marks_missing_parts(self):
+        content = (
+            _http_part(1, 'HTTP/1.1 200 OK', '{"id": "second"}')
+            + '--batch_test--\r\n'
+        ).encode('utf-8')
+
+        responses = decode_batch_response('multipart/mixed; boundary=batch_test', content, 3)
+
+        self.assertEqual(responses, [None, (200, '{"id": "second"}'), None])
+
+if __name__ == '__main__':
+    unittest.main()